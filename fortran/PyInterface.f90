@@ -536,6 +536,34 @@ contains
 
   end subroutine create_neighbor_list
 
+  ! Creates neighbor lists for all atoms at once.
+  ! The neighbor lists of all atoms are given concatenated in one array
+  ! so that the neighbors of atom 1 come first, followed by those of atom 2 etc.
+  ! The lists are split according to the given numbers of neighbors.
+  ! 
+  ! Calls :func:`core_create_neighbor_list`
+  !
+  ! *n_atoms number of atoms
+  ! *n_total total number of neighbors of all atoms
+  ! *n_nbs the numbers of neighbors of each atom
+  ! *neighbors An array containing the indices of the neighboring atoms
+  ! *offsets An array containing vectors specifying the offsets of the neighbors in periodic systems.
+  subroutine create_neighbor_lists_of_all_atoms(n_atoms,n_total,n_nbs,neighbors,offsets)
+    implicit none
+    integer, intent(in) :: n_atoms, n_total
+    integer, intent(in) :: n_nbs(n_atoms), neighbors(n_total), offsets(3,n_total)
+    integer :: i, first
+
+    first = 1
+    do i = 1, n_atoms
+       ! add +1 to neighbors because python indexing begins from 0 and fortran from 1
+       call core_create_neighbor_list(n_nbs(i),i,neighbors(first:first+n_nbs(i)-1)+1,&
+            offsets(1:3,first:first+n_nbs(i)-1)) ! in Core.f90
+       first = first + n_nbs(i)
+    end do
+
+  end subroutine create_neighbor_lists_of_all_atoms
+
   ! Creates a list of indices for all atoms showing which potentials
   ! act on them.
   ! The user may define many potentials to sum up the potential energy of the
@@ -658,6 +686,36 @@ contains
   end subroutine calculate_energy
 
 
+  ! Returns the total potential energies of several configurations of the system
+  !
+  ! The configurations are given as sets of atomic positions, one after
+  ! another. All the other properties of the atoms as well as the neighbor
+  ! lists are kept unchanged, so the positions must be close enough to
+  ! the current ones for the neighbor lists to remain valid.
+  ! Note that the positions of the last configuration are left in the core.
+  ! 
+  ! Calls :func:`core_update_atom_coordinates` and :func:`core_calculate_energy`
+  !
+  ! *n_atoms number of atoms
+  ! *n_confs number of configurations
+  ! *positions coordinates of the atoms in all the configurations
+  ! *momenta momenta of the atoms
+  ! *energies total potential energies of the configurations
+  subroutine calculate_energies_of_configurations(n_atoms,n_confs,positions,momenta,energies)
+    implicit none
+    integer, intent(in) :: n_atoms, n_confs
+    double precision, intent(in) :: positions(3,n_atoms,n_confs), momenta(3,n_atoms)
+    double precision, intent(out) :: energies(n_confs)
+    integer :: i
+
+    do i = 1, n_confs
+       call core_update_atom_coordinates(n_atoms,positions(1:3,1:n_atoms,i),momenta) ! in Core.f90
+       call core_calculate_energy(energies(i)) ! in Core.f90
+    end do
+
+  end subroutine calculate_energies_of_configurations
+
+
   ! Returns forces acting on the particles and the stress tensor
   ! 
   ! Calls :func:`core_calculate_forces`
@@ -1093,6 +1151,58 @@ contains
 
   end subroutine get_neighbor_list_of_atom
 
+  ! Returns the positions of the neighbor lists of all atoms in the
+  ! concatenated array returned by :func:`get_neighbor_lists_of_all_atoms`.
+  ! In Python indexing, the neighbors of atom i are found between
+  ! pointers(i) and pointers(i+1), and pointers(n_atoms+1) is the
+  ! total number of neighbors.
+  !
+  ! *n_atoms number of atoms
+  ! *pointers the starting indices of the neighbor lists of all atoms
+  subroutine get_neighbor_list_pointers(n_atoms,pointers)
+    implicit none
+    integer, intent(in) :: n_atoms
+    integer, intent(out) :: pointers(n_atoms+1)
+    integer :: i, n_nbs
+
+    pointers(1) = 0
+    do i = 1, n_atoms
+       call core_get_number_of_neighbors(i,n_nbs)
+       pointers(i+1) = pointers(i) + n_nbs
+    end do
+
+  end subroutine get_neighbor_list_pointers
+
+  ! Returns the neighbor lists of all atoms concatenated in one array.
+  ! The neighbors of atom 1 come first, followed by those of atom 2 etc.,
+  ! so the lists can be split using the pointers given by
+  ! :func:`get_neighbor_list_pointers`.
+  !
+  ! *n_atoms number of atoms
+  ! *n_total total number of neighbors of all atoms
+  ! *neighbors the indices of the neighboring atoms
+  ! *offsets the offsets for periodic boundaries
+  subroutine get_neighbor_lists_of_all_atoms(n_atoms, n_total, neighbors, offsets)
+    implicit none
+    integer, intent(in) :: n_atoms, n_total
+    integer, intent(out) :: neighbors(n_total), offsets(3,n_total)
+    integer :: i, n_nbs, first
+
+    first = 1
+    do i = 1, n_atoms
+       call core_get_number_of_neighbors(i,n_nbs)
+       if(n_nbs > 0)then
+          call core_get_neighbor_list_of_atom(i, n_nbs, neighbors(first:first+n_nbs-1), &
+               offsets(1:3,first:first+n_nbs-1))
+          first = first + n_nbs
+       end if
+    end do
+
+    ! shift the indices by one since python starts indexing at 0 while fortran does so at 1
+    neighbors = neighbors-1
+
+  end subroutine get_neighbor_lists_of_all_atoms
+
 
   ! Clears the temporary stored array of multiplier potentials
   subroutine clear_potential_multipliers()
@@ -15,18 +15,19 @@ from pysic.charges.relaxation import ChargeRelaxation
 
 import pysic.pysic_fortran as pf
 import pysic.utility.f2py as pu
+import pysic.utility.geometry as pg
+import pysic.utility.convenience as pc
 
 import numpy as np
 import numpy.linalg as npla
 import ase.calculators.neighborlist as nbl
-from itertools import permutations
 import copy
 import math
 
 import pysic.utility.debug as d
 
 
-class FastNeighborList(nbl.NeighborList):
+class FastNeighborList(nbl.NeighborList, object):
     """ASE has a neighbor list class built in, `ASE NeighborList`_, but its implementation is
         currently inefficient, and building of the list is an :math:`O(n^2)`
         operation. This neighbor list class overrides the 
@@ -40,6 +41,12 @@ class FastNeighborList(nbl.NeighborList):
         searches for the neighbors of each atom at a distance of the cutoff of the
         given atom only, plus skin.
         
+        The lists of all atoms are stored in compressed sparse row format:
+        the neighbors of atom ``i`` are
+        ``neighbor_indices[neighbor_pointers[i]:neighbor_pointers[i+1]]``
+        and their offsets are the corresponding rows of ``neighbor_offsets``.
+        The ASE style per-atom lists ``neighbors`` and ``displacements``
+        are only generated if they are accessed.
         
         .. _ASE Atoms: https://wiki.fysik.dtu.dk/ase/ase/atoms.html
         .. _ASE NeighborList: https://wiki.fysik.dtu.dk/ase/ase/calculators/calculators.html#building-neighbor-lists
@@ -58,6 +65,35 @@ class FastNeighborList(nbl.NeighborList):
                               sorted=False, 
                               self_interaction=False,
                               bothways=True)    
+        self.neighbor_pointers = None
+        self.neighbor_indices = None
+        self.neighbor_offsets = None
+        self.per_atom_lists = None
+
+    @property
+    def neighbors(self):
+        """List of arrays containing the neighbor indices of each atom.
+
+        The list is generated from the compressed storage on first access."""
+        return self.get_per_atom_lists()[0]
+
+    @property
+    def displacements(self):
+        """List of arrays containing the neighbor offsets of each atom.
+
+        The list is generated from the compressed storage on first access."""
+        return self.get_per_atom_lists()[1]
+
+    def get_per_atom_lists(self):
+        """Returns the neighbors and offsets split into lists of arrays, one array per atom.
+        
+        The arrays are views of the compressed storage.
+        """
+        if self.per_atom_lists is None:
+            starts = self.neighbor_pointers[1:-1]
+            self.per_atom_lists = (np.split(self.neighbor_indices, starts),
+                                   np.split(self.neighbor_offsets, starts))
+        return self.per_atom_lists
     
     def build(self,atoms):
         """Builds the neighbor list.
@@ -73,9 +109,9 @@ class FastNeighborList(nbl.NeighborList):
             structure. It does raise an error if the structures do not match, though.
             
             The neighbor search is done via the :meth:`generate_neighbor_lists` routine.
-            The routine builds the neighbor list in the core, after which the list is
-            fed back to the :class:`~pysic.calculator.FastNeighborList` object by looping over all
-            atoms and saving the lists of neighbors and offsets.
+            The routine builds the neighbor list in the core, after which the lists of
+            all atoms are fetched back to the :class:`~pysic.calculator.FastNeighborList` object
+            in one go and stored as concatenated arrays of neighbors and offsets.
 
             Parameters:
             
@@ -94,17 +130,20 @@ class FastNeighborList(nbl.NeighborList):
         
         
         pf.pysic_interface.generate_neighbor_lists(self.cutoffs)
-                
-        self.neighbors = [np.empty(0, int) for a in range(len(atoms))]
-        self.displacements = [np.empty((0, 3), int) for a in range(len(atoms))]
-        
-        for i in range(len(atoms)):
-            n_nbs = pf.pysic_interface.get_number_of_neighbors_of_atom(i)
-            if n_nbs > 0:
-                (self.neighbors[i], self.displacements[i]) = pf.pysic_interface.get_neighbor_list_of_atom(i,n_nbs)
-                # the offsets are in Fortran array format, so they need to be transposed
-                self.displacements[i] = np.transpose(self.displacements[i])
-    
+
+        n_atoms = len(atoms)
+        self.neighbor_pointers = pf.pysic_interface.get_neighbor_list_pointers(n_atoms)
+        n_total = int(self.neighbor_pointers[-1])
+        if n_total > 0:
+            (self.neighbor_indices, offsets) = \
+                pf.pysic_interface.get_neighbor_lists_of_all_atoms(n_atoms,n_total)
+            # the offsets are in Fortran array format, so the transpose is a C ordered view
+            self.neighbor_offsets = np.transpose(offsets)
+        else:
+            self.neighbor_indices = np.empty(0, dtype=np.int32)
+            self.neighbor_offsets = np.empty((0, 3), dtype=np.int32)
+        self.per_atom_lists = None
+
         self.nupdates += 1
     
     
@@ -122,9 +161,11 @@ class FastNeighborList(nbl.NeighborList):
         sort: boolean
             if True, the list will be sorted according to distance
         """
-        n_nbs = pf.pysic_interface.get_number_of_neighbors_of_atom(index)
-        nbors = self.neighbors[index][0:n_nbs]
-        displ = self.displacements[index][0:n_nbs]
+        start = self.neighbor_pointers[index]
+        end = self.neighbor_pointers[index+1]
+        n_nbs = end - start
+        nbors = self.neighbor_indices[start:end]
+        displ = self.neighbor_offsets[start:end]
         
         if sort and atoms is not None and n_nbs > 0:
             dists = self.get_neighbor_distances(index, atoms)
@@ -148,19 +189,13 @@ class FastNeighborList(nbl.NeighborList):
         """
         
         indices, offsets = self.get_neighbors(index)
-        separations = np.array(len(indices)*[[0.0,0.0,0.0]])
-        dists = np.array(len(separations)*[0.0])
-        running = 0
-        for i, offset in zip(indices, offsets):
-            sep = atoms.positions[i] + np.dot(offset, atoms.get_cell()) - atoms.positions[index]
-            
-            separations[running] = sep
-            if sort:
-                dists[running] = math.sqrt(np.dot(sep,sep))                
-            running += 1
+        # the offsets are stored as contiguous rows, so all periodic shifts
+        # are obtained with a single matrix product
+        separations = atoms.positions[indices] + np.dot(offsets, atoms.get_cell()) - atoms.positions[index]
 
         if sort:
-            return np.array([s for (d,s) in sorted(zip(dists, separations), key=lambda dis: dis[0])])
+            dists = np.sqrt((separations*separations).sum(axis=1))
+            return separations[np.argsort(dists, kind='mergesort')]
         
         return separations
 
@@ -177,11 +212,7 @@ class FastNeighborList(nbl.NeighborList):
             if True, the list will be sorted according to distance
         """
         separations = self.get_neighbor_separations(index, atoms)
-        dists = np.array(len(separations)*[0.0])
-        running = 0
-        for sep in separations:
-            dists[running] = math.sqrt(np.dot(sep,sep))
-            running += 1
+        dists = np.sqrt((separations*separations).sum(axis=1))
 
         if sort:
             return np.array(sorted(dists))
@@ -234,6 +265,8 @@ class Pysic:
         
         self.neighbor_lists_ready = False
         self.saved_cutoffs = None
+        self.cutoff_cache = None
+        self.cell_width_cache = None
         
         self.structure = None
         self.neighbor_list = None
@@ -258,31 +291,28 @@ class Pysic:
 
 
     def __eq__(self,other):
-        try:
-            if self.structure != other.structure:
-                return False
-            if any(self.structure.get_initial_charges() != other.structure.get_initial_charges()):
-                return False
-            if self.neighbor_list != other.neighbor_list:
-                return False
-            if self.potentials != other.potentials:
-                return False
-            if self.extra_calculators != other.extra_calculators:
-                return False
-        except:
-            try:
-                if self.structure != other.structure:
-                    return False
-                if any(self.structure.get_charges() != other.structure.get_charges()):
-                    return False
-                if self.neighbor_list != other.neighbor_list:
-                    return False
-                if self.potentials != other.potentials:
-                    return False
-                if self.extra_calculators != other.extra_calculators:
-                    return False
-            except:
+        if other is self:
+            return True
+        if not isinstance(other, Pysic):
+            return False
+        if self.structure != other.structure:
+            return False
+        if self.structure is not None:
+            # the call for charges was changed between ASE 3.6 and 3.7
+            if hasattr(self.structure, 'get_initial_charges'):
+                charges_match = np.array_equal(self.structure.get_initial_charges(),
+                                               other.structure.get_initial_charges())
+            else:
+                charges_match = np.array_equal(self.structure.get_charges(),
+                                               other.structure.get_charges())
+            if not charges_match:
                 return False
+        if self.neighbor_list != other.neighbor_list:
+            return False
+        if self.potentials != other.potentials:
+            return False
+        if self.extra_calculators != other.extra_calculators:
+            return False
 
         return True
 
@@ -300,7 +330,7 @@ class Pysic:
         return self.force_core_initialization
 
 
-    def force_core_initialization(self,new_mode):
+    def set_force_core_initialization(self,new_mode):
         """Set the core initialization mode.
 
         Parameters:
@@ -331,24 +361,26 @@ class Pysic:
             list of keywords 'energy', 'forces', 'stress', 'electronegativities'
         """
         
-        do_it = []
-        try:
-            assert isinstance(quantities, list)
+        if isinstance(quantities, list):
             list_of_quantities = quantities
-        except:
+        else:
             list_of_quantities = [ quantities ]
         
+        # Missing results are checked first, since they are cheap
+        # and already decide the answer without consulting the core.
         for mark in list_of_quantities:
             if mark == 'energy':
-                do_it.append(self.energy is None)
+                if self.energy is None:
+                    return True
             elif mark == 'forces':
-                do_it.append(self.forces is None)
+                if self.forces is None:
+                    return True
             elif mark == 'electronegativities':
-                do_it.append(self.electronegativities is None)
+                if self.electronegativities is None:
+                    return True
             elif mark == 'stress':
-                do_it.append(self.stress is None)
-            else:
-                do_it.append(False)
+                if self.stress is None:
+                    return True
         
         # If the core does not match the Pysic calculator,
         # we may have changed the system or potentials
@@ -357,20 +389,7 @@ class Pysic:
         # It is of course possible that we have several Pysics
         # changing the core which would lead to unnecessary
         # recalculations.
-        if(not Pysic.core.atoms_ready(self.structure)):
-            #print "atoms"
-            do_it.append(True)
-        if(not Pysic.core.charges_ready(self.structure)):
-            #print "charges"
-            do_it.append(True)
-        if(not Pysic.core.cell_ready(self.structure)):
-            #print "cell"
-            do_it.append(True)
-        if(not Pysic.core.potentials_ready(self.potentials)):
-            #print "potentials"
-            do_it.append(True)
-            
-        return any(do_it)
+        return Pysic.core.state_mismatch(self.structure, self.potentials) != 0
 
 
     def get_atoms(self):
@@ -518,17 +537,13 @@ class Pysic:
         # but we add the kinetic contribution on the fly
         momenta = self.structure.get_momenta()
         masses = self.structure.get_masses()
-        velocities = np.divide( momenta, np.array([masses,masses,masses]).transpose() )
+        velocities = momenta / masses[:,np.newaxis]
 
-        kinetic_stress = np.array([0.0]*6)
+        # the full tensor sum_i (p_i)_A (v_i)_B in one pass
+        kinetic_tensor = np.einsum('ij,ik->jk', momenta, velocities)
         
         # s_xx, s_yy, s_zz, s_yz, s_xz, s_xy
-        kinetic_stress[0] = np.dot( momenta[:,0], velocities[:,0] )
-        kinetic_stress[1] = np.dot( momenta[:,1], velocities[:,1] )
-        kinetic_stress[2] = np.dot( momenta[:,2], velocities[:,2] )
-        kinetic_stress[3] = np.dot( momenta[:,1], velocities[:,2] )
-        kinetic_stress[4] = np.dot( momenta[:,0], velocities[:,2] )
-        kinetic_stress[5] = np.dot( momenta[:,0], velocities[:,1] )
+        kinetic_stress = kinetic_tensor[[0,1,2,1,0,0],[0,1,2,2,2,1]]
                 
         # ASE NPT simulator wants the pressure with an inversed sign
         return np.copy(-( kinetic_stress + self.stress ) / self.structure.get_volume())
@@ -558,18 +573,19 @@ class Pysic:
         atoms: `ASE atoms`_ object
             the structure to be calculated
         """
-        if atoms == None:
+        # the saved structure itself is trivially up to date
+        if atoms is None or atoms is self.structure:
             pass
         else:
-            atoms_changed = False
-            
+            if self.structure is None or self.structure != atoms:
+                atoms_changed = True
             # the call for charges was changed between ASE 3.6 and 3.7
-            try:
-                atoms_changed = self.structure != atoms or \
-                    (self.structure.get_initial_charges() != atoms.get_initial_charges()).any()
-            except:
-                atoms_changed = self.structure != atoms or \
-                    (self.structure.get_charges() != atoms.get_charges()).any()
+            elif hasattr(atoms, 'get_initial_charges'):
+                atoms_changed = not np.array_equal(self.structure.get_initial_charges(),
+                                                   atoms.get_initial_charges())
+            else:
+                atoms_changed = not np.array_equal(self.structure.get_charges(),
+                                                   atoms.get_charges())
 
             if(atoms_changed):
                 self.forces = None
@@ -579,26 +595,26 @@ class Pysic:
                 
 
                 # NB: this avoids updating the potential lists every time an atom moves
-                try:
-                    if((self.structure.get_atomic_numbers() != atoms.get_atomic_numbers()).any()):
-                        Pysic.core.potential_lists_ready = False
-                        self.neighbor_lists_waiting = False
-
-                    if((self.structure.get_tags() != atoms.get_tags()).any()):
-                        Pysic.core.potential_lists_ready = False
-                        self.neighbor_lists_waiting = False                
-
-                    if(not Pysic.core.potentials_ready(self.potentials)):
-                        Pysic.core.potential_lists_ready = False
-                        self.neighbor_lists_waiting = False
+                if self.structure is None:
+                    targets_changed = True
+                else:
+                    targets_changed = \
+                        not np.array_equal(self.structure.get_atomic_numbers(), atoms.get_atomic_numbers()) or \
+                        not np.array_equal(self.structure.get_tags(), atoms.get_tags())
 
-                except:
+                if targets_changed or not Pysic.core.potentials_ready(self.potentials):
                     Pysic.core.potential_lists_ready = False
                     self.neighbor_lists_waiting = False
             
-
+                old_structure = self.structure
                 self.structure = atoms.copy()
 
+                # the cutoffs only depend on the elements and tags of the atoms,
+                # so if only the geometry changed, the saved cutoffs remain valid
+                if not targets_changed and self.cutoff_cache is not None:
+                    if self.cutoff_cache[0] is old_structure:
+                        self.cutoff_cache = (self.structure,) + self.cutoff_cache[1:]
+
 
     def set_potentials(self, potentials):
         """Assign a list of potentials to the calculator.
@@ -617,22 +633,14 @@ class Pysic:
         if potentials is None:
             pass
         else:
-            self.forces = None
-            self.energy = None
-            self.stress = None
-            self.electronegativities = None
-            
-            new_cutoffs = self.get_individual_cutoffs(1.0)
-            self.neighbor_lists_waiting = not self.neighbor_lists_expanded(new_cutoffs)
-
-            try:
-                assert isinstance(potentials,list)
+            if isinstance(potentials,list):
                 potlist = potentials
-            except:
+            else:
                 potlist = [potentials]
 
-            for pot in potlist:
-                self.add_potential(pot)
+            # add all potentials at once so that the cutoffs
+            # and neighbor list status are only reevaluated once
+            self.add_potential(potlist)
     
     
     def add_calculator(self,calculator):
@@ -828,15 +836,14 @@ class Pysic:
             cutoffs = self.get_individual_cutoffs(1.0)
         max_cut = np.max(cutoffs)+marginal
         
-            
-        for i in range(3):
-            vec = self.structure.get_cell()[i]
-            other_vec1 = self.structure.get_cell()[(i+1)%3]
-            other_vec2 = self.structure.get_cell()[(i+2)%3]
-            normal = np.cross(other_vec1,other_vec2)
-            length = math.fabs(np.dot(vec,normal))/math.sqrt(np.dot(normal,normal))
-            if length < max_cut:                
-                fastlist = False
+        # the fast list needs the cell to be wider than the cutoff in all directions
+        # the width only changes with the cell, so it is remembered between calls
+        cell = self.structure.get_cell()
+        cell_key = cell.tostring()
+        if self.cell_width_cache is None or self.cell_width_cache[0] != cell_key:
+            self.cell_width_cache = (cell_key, pg.minimum_cell_width(cell))
+        if self.cell_width_cache[1] < max_cut:
+            fastlist = False
                 
         if fastlist:
             try:
@@ -865,6 +872,12 @@ class Pysic:
         of scaled values are required, the scaler can be adjusted. E.g., scaler = 0.5
         will return the cutoffs halved.
 
+        The maximum cutoffs are first collected per symbol, tag and index
+        from the potentials, after which each atom only needs a few lookups.
+        The result is saved, and it is reused as long as the structure,
+        the cutoffs and targets of the potentials, and the Coulomb cutoff
+        stay the same.
+
         Parameters:
 
         scaler: double
@@ -878,40 +891,54 @@ class Pysic:
             else:
                 return self.structure.get_number_of_atoms()*[self.coulomb.get_realspace_cutoff()]
         else:
-            cuts = []            
+            if self.coulomb == None:
+                base_cut = 0.0
+            else:
+                base_cut = self.coulomb.get_realspace_cutoff()
+
+            # find the longest cutoff affecting each symbol, tag and index
+            symbol_cuts = {}
+            tag_cuts = {}
+            index_cuts = {}
+            for potential in self.potentials:
+                cut = potential.get_cutoff()
+                for symbol in potential.get_different_symbols():
+                    symbol_cuts[symbol] = max(cut, symbol_cuts.get(symbol,0.0))
+                for tag in potential.get_different_tags():
+                    tag_cuts[tag] = max(cut, tag_cuts.get(tag,0.0))
+                for index in potential.get_different_indices():
+                    index_cuts[index] = max(cut, index_cuts.get(index,0.0))
+
+                try:
+                    for bond in potential.get_coordinator().get_bond_order_parameters():
+                        bond_cut = bond.get_cutoff()
+                        for symbol in bond.get_different_symbols():
+                            symbol_cuts[symbol] = max(bond_cut, symbol_cuts.get(symbol,0.0))
+                except:
+                    pass
+
+            key = (scaler, base_cut,
+                   sorted(symbol_cuts.items()),
+                   sorted(tag_cuts.items()),
+                   sorted(index_cuts.items()))
+            if self.cutoff_cache is not None:
+                cached_structure, cached_key, cached_cuts = self.cutoff_cache
+                if cached_structure is self.structure and cached_key == key:
+                    return cached_cuts.tolist()
+
+            cuts = []
             # loop over all atoms, with symbol, tags, index containing the corresponding
             # info for a single atom at a time
             for symbol, tags, index in zip(self.structure.get_chemical_symbols(),
                                            self.structure.get_tags(),
                                            range(self.structure.get_number_of_atoms())):
-            
-                if self.coulomb == None:
-                    max_cut = 0.0
-                else:
-                    max_cut = self.coulomb.get_realspace_cutoff()
-                
-                for potential in self.potentials:
-                    active_potential = False
-
-                    if potential.get_different_symbols().count(symbol) > 0 or potential.get_different_tags().count(tags) > 0 or potential.get_different_indices().count(index) > 0:
-                        active_potential = True
-
-                    if active_potential and potential.get_cutoff() > max_cut:
-                        max_cut = potential.get_cutoff()
-
-                    try:
-                        for bond in potential.get_coordinator().get_bond_order_parameters():
-                            active_bond = False
-                            if bond.get_different_symbols().count(symbol) > 0:
-                                active_bond = True
-                                
-                            if active_bond:
-                                if bond.get_cutoff() > max_cut:
-                                    max_cut = bond.get_cutoff()
-                    except:
-                        pass
-            
+                max_cut = max(base_cut,
+                              symbol_cuts.get(symbol,0.0),
+                              tag_cuts.get(tags,0.0),
+                              index_cuts.get(index,0.0))
                 cuts.append(max_cut*scaler)
+
+            self.cutoff_cache = (self.structure, key, np.array(cuts, dtype=np.float64))
             return cuts
 
 
@@ -922,7 +949,7 @@ class Pysic:
         """
         self.set_core()
         n_atoms = pf.pysic_interface.get_number_of_atoms()
-        self.electronegativities = pf.pysic_interface.calculate_electronegativities(n_atoms).transpose()
+        self.electronegativities = pf.pysic_interface.calculate_electronegativities(n_atoms)
         
     
     def calculate_forces(self, skip_charge_relaxation=False):
@@ -937,7 +964,9 @@ class Pysic:
         if self.charge_relaxation is not None and skip_charge_relaxation == False:
             self.charge_relaxation.charge_relaxation()
         n_atoms = pf.pysic_interface.get_number_of_atoms()
-        self.forces, self.stress = pf.pysic_interface.calculate_forces(n_atoms)#.transpose()
+        self.forces, self.stress = pf.pysic_interface.calculate_forces(n_atoms)
+        # the core returns a Fortran-ordered (3,n) array, so the transpose
+        # is a C-contiguous (n,3) view and no data is copied
         self.forces = self.forces.transpose()
 
         if not self.extra_calculators is None:
@@ -978,21 +1007,11 @@ class Pysic:
         """Calculates the potential part of the stress tensor (and forces).
 
         Calls the Fortran core to calculate the stress tensor for the currently assigned structure.
-        """
 
-        if self.charge_relaxation is not None and skip_charge_relaxation == False:            self.charge_relaxation.charge_relaxation()
-        
-        self.set_core()
-        n_atoms = pf.pysic_interface.get_number_of_atoms()
-        self.forces, self.stress = pf.pysic_interface.calculate_forces(n_atoms)
-        self.forces = self.forces.transpose()
-
-        if not self.extra_calculators is None:
-            if len(self.extra_calculators) > 0:
-                system_copy = copy.deepcopy(self.system)
-                for calc in self.extra_calculators:
-                    self.forces = self.forces + calc.get_forces(system_copy)
-                    self.stress = self.stress + calc.get_stress(system_copy)
+        The stress is evaluated in the same loop as the forces, so this
+        is done through :meth:`~pysic.calculator.Pysic.calculate_forces`.
+        """
+        self.calculate_forces(skip_charge_relaxation=skip_charge_relaxation)
 
 
     def set_core(self):
@@ -1019,16 +1038,20 @@ class Pysic:
         if do_full_init:
             self.initialize_fortran_core()
         else:
-            if not Pysic.core.cell_ready(self.structure):
+            # the updates below do not affect each other's parts of the core,
+            # so the mismatching parts can all be checked at once
+            mismatch = Pysic.core.state_mismatch(self.structure, self.potentials)
+
+            if mismatch & CoreMirror.cell_mismatch:
                 self.update_core_supercell()
             
-            if not Pysic.core.atoms_ready(self.structure):
+            if mismatch & CoreMirror.atoms_mismatch:
                 self.update_core_coordinates()
             
-            if not Pysic.core.charges_ready(self.structure):
+            if mismatch & CoreMirror.charges_mismatch:
                 self.update_core_charges()
                     
-            if not Pysic.core.potentials_ready(self.potentials):
+            if mismatch & CoreMirror.potentials_mismatch:
                 self.update_core_potentials()
 
             if self.coulomb != None:
@@ -1064,6 +1087,7 @@ class Pysic:
         """Generates potentials for the Fortran core."""
         
         Pysic.core.potential_lists_ready = False
+        self.cutoff_cache = None
         if self.potentials == None:
             pf.pysic_interface.allocate_potentials(0)
             pf.pysic_interface.allocate_bond_order_factors(0)
@@ -1081,6 +1105,39 @@ class Pysic:
             warn("There are no potentials associated with the Pysic calculator!",2)
             return
         
+        # The distinct permutations of the targets and the integer codes
+        # of the symbols may be needed for several potentials and bond
+        # order factors, so they are only generated once.
+        permutation_cache = {}
+        def different_permutations(targets):
+            key = tuple(targets)
+            if not key in permutation_cache:
+                permutation_cache[key] = pc.distinct_permutations(targets)
+            return permutation_cache[key]
+
+        label_cache = {}
+        def label_to_ints(label):
+            if not label in label_cache:
+                label_cache[label] = pu.str2ints(label,2)
+            return label_cache[label]
+
+        # The core expects the symbols, tags and indices of a potential as
+        # separate arrays, with placeholders for those not targeted.
+        # The placeholders only depend on the number of targets.
+        blank_cache = {}
+        def no_targets(n_targ):
+            if not n_targ in blank_cache:
+                blank_cache[n_targ] = [np.array( n_targ*[label_to_ints('xx')], dtype=np.int32 ).transpose(),
+                                       np.array( n_targ*[-9], dtype=np.int32 ),
+                                       np.array( n_targ*[-9], dtype=np.int32 )]
+            return blank_cache[n_targ]
+
+        def target_array(kind, targets):
+            # kind is 0 for symbols, 1 for tags and 2 for indices
+            if kind == 0:
+                return np.array( [label_to_ints(label) for label in targets], dtype=np.int32 ).transpose()
+            return np.array( targets, dtype=np.int32 )
+
         n_pots = 0
         coord_list = []
         pot_index = 0
@@ -1163,33 +1220,27 @@ class Pysic:
                                 " bond order factor on a "+str(pot.get_number_of_targets())+\
                                 "-body potential: it will be zero!",1)
             
-            try:
-                alltargets = pot.get_symbols()
-                for targets in alltargets:
-                    perms = permutations(targets)
-                    different = set(perms)
-                    n_pots += len(different)
-            except:
-                if not pot.get_symbols() is None:
-                    raise InvalidPotentialError("Invalid potential symbols: "+str(pot.get_symbols()))
-            try:
-                alltargets = pot.get_tags()
-                for targets in alltargets:
-                    perms = permutations(targets)
-                    different = set(perms)
-                    n_pots += len(different)
-            except:
-                if not pot.get_tags() is None:
-                    raise InvalidPotentialError("Invalid potential tags: "+str(pot.get_tags()))
-            try:
-                alltargets = pot.get_indices()
-                for targets in alltargets:
-                    perms = permutations(targets)
-                    different = set(perms)
-                    n_pots += len(different)
-            except:
-                if not pot.get_indices() is None:
-                    raise InvalidPotentialError("Invalid potential indices: "+str(pot.get_indices()))
+            alltargets = pot.get_symbols()
+            if not alltargets is None:
+                try:
+                    for targets in alltargets:
+                        n_pots += pc.distinct_permutation_count(targets)
+                except:
+                    raise InvalidPotentialError("Invalid potential symbols: "+str(alltargets))
+            alltargets = pot.get_tags()
+            if not alltargets is None:
+                try:
+                    for targets in alltargets:
+                        n_pots += pc.distinct_permutation_count(targets)
+                except:
+                    raise InvalidPotentialError("Invalid potential tags: "+str(alltargets))
+            alltargets = pot.get_indices()
+            if not alltargets is None:
+                try:
+                    for targets in alltargets:
+                        n_pots += pc.distinct_permutation_count(targets)
+                except:
+                    raise InvalidPotentialError("Invalid potential indices: "+str(alltargets))
                 
         pf.pysic_interface.allocate_potentials(n_pots)
 
@@ -1234,140 +1285,64 @@ class Pysic:
             if not mul:
                 pot_index += 1
 
-            n_targ = mpot.get_number_of_targets()
-            no_symbs = np.array( n_targ*[pu.str2ints('xx',2)] ).transpose()
-            no_tags = np.array( n_targ*[-9] )
-            no_inds = np.array( n_targ*[-9] )
-
-            try:
-                        
-                if mul:
-                    alltargets = [mpot.get_symbols()[0]]
-                else:
-                    alltargets = mpot.get_symbols()
-                for targets in alltargets:
-                    int_orig_symbs = []
-                    for orig_symbs in targets:
-                        int_orig_symbs.append( pu.str2ints(orig_symbs,2) )
-
-                    if mul:
-                        different = [targets]
-                    else:
-                        perms = permutations(targets)
-                        different = set(perms)
-
-                    for symbs in different:
-                        int_symbs = []
-                        for label in symbs:
-                            int_symbs.append( pu.str2ints(label,2) )
-
-                        if not mul or not multiplier_added:
-                            success = pf.pysic_interface.add_potential(pot.get_potential_type(),
-                                                         np.array( pot.get_parameter_values() ),
-                                                         mpot.get_cutoff(),
-                                                         mpot.get_soft_cutoff(),
-                                                         np.array( int_symbs ).transpose(),
-                                                         no_tags,
-                                                         no_inds,
-                                                         np.array( int_orig_symbs ).transpose(),
-                                                         no_tags,
-                                                         no_inds,
-                                                         group_index,
-                                                         mul )
-                            multiplier_added = True
-                        else:
-                            success = True
-
-                        if not success:
-                            raise InvalidPotentialError("")
-            except:
-                if not mpot.get_symbols() is None:
-                    raise InvalidPotentialError("Failed to create a potential in the core: "+str(mpot))
-            try:
-                if mul:
-                    alltargets = [mpot.get_tags()[0]]
-                else:
-                    alltargets = mpot.get_tags()
-                for targets in alltargets:
-                    orig_tags = targets
-
-                    if mul:
-                        different = [targets]
-                    else:
-                        perms = permutations(targets)
-                        different = set(perms)
-
-                    for tags in different:
-                                                
-                        if not mul or not multiplier_added:
-                        
-                            success = pf.pysic_interface.add_potential(pot.get_potential_type(),
-                                                         np.array( pot.get_parameter_values() ),
-                                                         mpot.get_cutoff(),
-                                                         mpot.get_soft_cutoff(),
-                                                         no_symbs,
-                                                         np.array( tags ),
-                                                         no_inds,
-                                                         no_symbs,
-                                                         np.array(orig_tags),
-                                                         no_inds,
-                                                         group_index,
-                                                         mul)
-                        
-                            multiplier_added = True
-                        else:
-                            success = True
-                        
-                        if not success:
-                            raise InvalidPotentialError("")
-            except:
-                if not mpot.get_tags() is None:
-                    raise InvalidPotentialError("Failed to create a potential in the core: "+str(mpot))
-            try:
-                if mul:
-                    alltargets = [mpot.get_indices()[0]]
-                else:
-                    alltargets = mpot.get_indices()                
-                for targets in alltargets:
-                    orig_inds = targets
-                        
+            # these are the same for all the permutations of the targets
+            pot_type = pot.get_potential_type()
+            pot_params = np.array( pot.get_parameter_values(), dtype=np.float64 )
+            pot_cutoff = mpot.get_cutoff()
+            pot_soft_cutoff = mpot.get_soft_cutoff()
+            blank_targets = no_targets(mpot.get_number_of_targets())
+
+            # the potential may target symbols, tags and indices, and
+            # those not targeted are passed to the core as blanks
+            for kind, alltargets in ((0, mpot.get_symbols()),
+                                     (1, mpot.get_tags()),
+                                     (2, mpot.get_indices())):
+                if alltargets is None:
+                    continue
+                try:
                     if mul:
-                        different = [targets]
-                    else:
-                        perms = permutations(targets)
-                        different = set(perms)
+                        alltargets = [alltargets[0]]
+                    for targets in alltargets:
+                        orig_targets = list(blank_targets)
+                        orig_targets[kind] = target_array(kind, targets)
 
-                    for inds in different:
-                                                
-                        if not mul or not multiplier_added:
-                        
-                            success = pf.pysic_interface.add_potential(pot.get_potential_type(),
-                                                         np.array( pot.get_parameter_values() ),
-                                                         mpot.get_cutoff(),
-                                                         mpot.get_soft_cutoff(),
-                                                         no_symbs,
-                                                         no_tags,
-                                                         np.array( inds ),
-                                                         no_symbs,
-                                                         no_tags,
-                                                         np.array(orig_inds),
-                                                         group_index,
-                                                         mul )
-                            multiplier_added = True
+                        if mul:
+                            different = [targets]
                         else:
-                            success = True
+                            different = different_permutations(targets)
+
+                        for perm in different:
+                            perm_targets = list(blank_targets)
+                            perm_targets[kind] = target_array(kind, perm)
+
+                            if not mul or not multiplier_added:
+                                success = pf.pysic_interface.add_potential(pot_type,
+                                                             pot_params,
+                                                             pot_cutoff,
+                                                             pot_soft_cutoff,
+                                                             perm_targets[0],
+                                                             perm_targets[1],
+                                                             perm_targets[2],
+                                                             orig_targets[0],
+                                                             orig_targets[1],
+                                                             orig_targets[2],
+                                                             group_index,
+                                                             mul )
+                                multiplier_added = True
+                            else:
+                                success = True
 
-
-                        if not success:
-                            raise InvalidPotentialError("")
-            except:
-                if not mpot.get_indices() is None:
+                            if not success:
+                                raise InvalidPotentialError("")
+                except:
                     raise InvalidPotentialError("Failed to create a potential in the core: "+str(mpot))
                         
-                        
             if not mul:
                 pf.pysic_interface.clear_potential_multipliers()
 
+        # The core needs to know the number of bond order factors before
+        # they are added, so the targets are first collected in one pass.
+        staged_bonds = []
         n_bonds = 0
         permutate = False
         for coord in coord_list:
@@ -1379,59 +1354,55 @@ class Pysic:
                     if (bond.get_number_of_targets() > 1 and bond.get_cutoff() < 0.01):
                         warn("Bond order factor with zero cutoff present: \n\n"+str(bond),1)
                 
+                    bond_targets = []
                     alltargets = bond.get_symbols()
                     for targets in alltargets:
                     
                         if(permutate):
                             # permutate bond factor symbols
-                            perms = permutations(targets)
-                            different = set(perms)
-                            n_bonds += len(different)
-
+                            different = different_permutations(targets)
                         else:
                             # do not permutate the bond factor symbols
-                            n_bonds += 1
+                            different = [targets]
+                        bond_targets.append([targets, different])
+                        n_bonds += len(different)
+
+                    staged_bonds.append([bond, coord[1], bond_targets])
             except:
                 raise InvalidParametersError("Invalid bond order parameter symbols: "+str(bond.get_symbols()))
 
         pf.pysic_interface.allocate_bond_order_factors(n_bonds)
 
-        for coord in coord_list:
+        for bond, group_index, bond_targets in staged_bonds:
             try:
-                allbonds = coord[0].get_bond_order_parameters()
-                for bond in allbonds:
-                    alltargets = bond.get_symbols()
-                    for targets in alltargets:
+                # these are the same for all the targets of the bond order factor
+                bond_type = bond.get_bond_order_type()
+                bond_params = np.array( bond.get_parameters_as_list(), dtype=np.float64 )
+                bond_n_params = np.array( bond.get_number_of_parameters(), dtype=np.int32 )
+                bond_cutoff = bond.get_cutoff()
+                bond_soft_cutoff = bond.get_soft_cutoff()
 
-                        int_orig_symbs = []
-                        for orig_symbs in targets:
-                            int_orig_symbs.append( pu.str2ints(orig_symbs,2) )
-                    
-                        if(permutate):
-                            # permutate bond factor symbols
-                            perms = permutations(targets)
-                            different = set(perms)
-                        else:
-                            # do not permutate the bond factor symbols
-                            different = [targets]
-
-                        for symbs in different:
-                            int_symbs = []
-                            for label in symbs:
-                                int_symbs.append( pu.str2ints(label,2) )
-
-                            success = pf.pysic_interface.add_bond_order_factor(bond.get_bond_order_type(),
-                                                                   np.array( bond.get_parameters_as_list() ),
-                                                                   np.array( bond.get_number_of_parameters() ),
-                                                                   bond.get_cutoff(),
-                                                                   bond.get_soft_cutoff(),
-                                                                   np.array( int_symbs ).transpose(),
-                                                                   np.array( int_orig_symbs ).transpose(),
-                                                                   coord[1])
-                            if not success:
-                                raise InvalidParametersError("")
+                for targets, different in bond_targets:
 
+                    int_orig_symbs = []
+                    for orig_symbs in targets:
+                        int_orig_symbs.append( label_to_ints(orig_symbs) )
 
+                    for symbs in different:
+                        int_symbs = []
+                        for label in symbs:
+                            int_symbs.append( label_to_ints(label) )
+
+                        success = pf.pysic_interface.add_bond_order_factor(bond_type,
+                                                               bond_params,
+                                                               bond_n_params,
+                                                               bond_cutoff,
+                                                               bond_soft_cutoff,
+                                                               np.array( int_symbs, dtype=np.int32 ).transpose(),
+                                                               np.array( int_orig_symbs, dtype=np.int32 ).transpose(),
+                                                               group_index)
+                        if not success:
+                            raise InvalidParametersError("")
             except:
                 raise InvalidParametersError("Failed to create a bond order factor in the core: "+str(bond))
 
@@ -1462,10 +1433,12 @@ class Pysic:
                 
                 # calculate the truncation limits for the k-space sum
                 reci_cell = np.multiply(2.0*math.pi,self.structure.get_reciprocal_cell())
-                volume = np.dot( reci_cell[0], np.cross( reci_cell[1], reci_cell[2] ) )
-                k1 = int( kcut * np.linalg.norm( np.cross( reci_cell[1], reci_cell[2] ) ) / volume + 0.5 )
-                k2 = int( kcut * np.linalg.norm( np.cross( reci_cell[0], reci_cell[2] ) ) / volume + 0.5 )
-                k3 = int( kcut * np.linalg.norm( np.cross( reci_cell[0], reci_cell[1] ) ) / volume + 0.5 )
+                # the cross products are needed both for the volume and the limits
+                crosses = np.array( [ np.cross( reci_cell[1], reci_cell[2] ),
+                                      np.cross( reci_cell[0], reci_cell[2] ),
+                                      np.cross( reci_cell[0], reci_cell[1] ) ] )
+                volume = np.dot( reci_cell[0], crosses[0] )
+                [k1, k2, k3] = [ int( kcut * np.linalg.norm( cross ) / volume + 0.5 ) for cross in crosses ]
 
                 if scales == None:
                     scales = [1.0]*self.structure.get_number_of_atoms()
@@ -1493,8 +1466,15 @@ class Pysic:
         if self.structure.get_number_of_atoms() != pf.pysic_interface.get_number_of_atoms():
             raise LockedCoreError("The number of atoms does not match.")
         
-        positions = np.array( self.structure.get_positions() ).transpose()
-        momenta = np.array( self.structure.get_momenta() ).transpose()
+        # The core only reads the arrays, so instead of the copies returned
+        # by ASE, the arrays of the structure are passed on directly.
+        # Their transposes are already in the Fortran order, so no new
+        # arrays are allocated at all.
+        positions = self.structure.arrays['positions'].transpose()
+        if 'momenta' in self.structure.arrays:
+            momenta = self.structure.arrays['momenta'].transpose()
+        else:
+            momenta = self.structure.get_momenta().transpose()
 
         self.forces = None
         self.energy = None
@@ -1508,6 +1488,15 @@ class Pysic:
                 
         if not self.neighbor_lists_waiting:
             self.create_neighbor_lists(self.get_individual_cutoffs(1.0))
+        elif self.neighbor_list.nupdates > 0:
+            # The core neighbor lists only contain indices and offsets, so
+            # they remain valid if the atoms have moved less than the skin
+            # since the lists were built (the criterion of the ASE list update).
+            if np.array_equal(self.neighbor_list.pbc, self.structure.get_pbc()) and \
+                    np.array_equal(self.neighbor_list.cell, self.structure.get_cell()) and \
+                    ((self.neighbor_list.positions - positions.transpose())**2).sum(1).max() <= \
+                    self.neighbor_list.skin**2:
+                return
         
         self.update_core_neighbor_lists()
 
@@ -1532,10 +1521,11 @@ class Pysic:
     def update_core_charges(self):
         """Updates atomic charges in the core."""
         
+        # ASE already returns a copy, which is stored as self.charges
         try:
-            charges = np.array( self.structure.get_initial_charges() )
+            charges = self.structure.get_initial_charges()
         except:
-            charges = np.array( self.structure.get_charges() )
+            charges = self.structure.get_charges()
 
         self.forces = None
         self.energy = None
@@ -1554,8 +1544,9 @@ class Pysic:
             
     def update_core_supercell(self):
         """Updates the supercell in the Fortran core."""
-        vectors = np.array( self.structure.get_cell() ).transpose()
-        inverse = np.linalg.inv(np.array( self.structure.get_cell() )).transpose()
+        cell = self.structure.get_cell()
+        vectors = cell.transpose()
+        inverse = np.linalg.inv(cell).transpose()
         periodicity = np.array( self.structure.get_pbc() )
         
         pf.pysic_interface.create_cell(vectors,inverse,periodicity)
@@ -1585,9 +1576,18 @@ class Pysic:
             pass
         else:
             # if we have used the ASE list, it must be passed on to the core
-            for index in range(self.structure.get_number_of_atoms()):
-                [nbors,offs] = self.neighbor_list.get_neighbors(index)                
-                pf.pysic_interface.create_neighbor_list(index+1,np.array(nbors),np.array(offs).transpose())
+            # the per-atom arrays of the ASE list are concatenated so that the core is called only once
+            # (empty displacement arrays may lack the second dimension, hence the reshape)
+            n_atoms = self.structure.get_number_of_atoms()
+            n_nbs = np.array([len(nbors) for nbors in self.neighbor_list.neighbors], dtype=np.int32)
+            if n_atoms > 0:
+                all_nbors = np.concatenate(self.neighbor_list.neighbors).astype(np.int32)
+                all_offs = np.concatenate([np.reshape(offs,(-1,3)) for offs in
+                                           self.neighbor_list.displacements]).astype(np.int32)
+            else:
+                all_nbors = np.zeros(0, dtype=np.int32)
+                all_offs = np.zeros((0,3), dtype=np.int32)
+            pf.pysic_interface.create_neighbor_lists_of_all_atoms(n_nbs,all_nbors,all_offs.transpose())
 
         Pysic.core.set_neighbor_lists(self.neighbor_list)
 
@@ -1605,15 +1605,17 @@ class Pysic:
             self.charges = np.array( self.structure.get_charges() )
         
         charges = self.charges
-        positions = np.array( self.structure.get_positions() ).transpose()
-        momenta = np.array( self.structure.get_momenta() ).transpose()
-        tags = np.array( self.structure.get_tags() )
+        positions = self.structure.get_positions().transpose()
+        momenta = self.structure.get_momenta().transpose()
+        tags = np.array( self.structure.get_tags(), dtype=np.int32 )
         elements = self.structure.get_chemical_symbols()
 
-        for index in range(len(elements)):
-            elements[index] = pu.str2ints(elements[index],2)
+        # there are usually only a few different elements, so each is coded only once
+        element_codes = {}
+        for symbol in set(elements):
+            element_codes[symbol] = pu.str2ints(symbol,2)
 
-        elements = np.array( elements ).transpose()
+        elements = np.array( [element_codes[symbol] for symbol in elements], dtype=np.int32 ).transpose()
 
         #self.create_neighbor_lists(self.get_individual_cutoffs(1.0))
         #self.neighbor_lists_waiting = True
@@ -1641,36 +1643,53 @@ class Pysic:
 
         This is for debugging the forces."""
 
-        if(atoms == None):
-            system = self.structure
-            orig_system = self.structure.copy()
-        else:
-            system = atoms.copy()
-            orig_system = atoms.copy()
-            self.set_atoms(system)
+        # the atoms are moved in the structure of the calculator itself,
+        # and only the original positions are saved for restoring them
+        self.set_atoms(atoms)
+        system = self.structure
+        orig_positions = system.get_positions()
         
         self.energy == None
-        energy_xp = self.get_potential_energy()
-        system[atom_index].x += shift
-        energy_xp = self.get_potential_energy()
-        system[atom_index].x -= 2.0*shift
-        energy_xm = self.get_potential_energy()
-        system[atom_index].x += shift
-
-        system[atom_index].y += shift
-        energy_yp = self.get_potential_energy()
-        system[atom_index].y -= 2.0*shift
-        energy_ym = self.get_potential_energy()
-        system[atom_index].y += shift
-
-        system[atom_index].z += shift
-        energy_zp = self.get_potential_energy()
-        system[atom_index].z -= 2.0*shift
-        energy_zm = self.get_potential_energy()
-        system[atom_index].z += shift
+        self.get_potential_energy()
+
+        # the structures where the atom is moved back and forth along each axis
+        positions = system.get_positions()
+        configurations = []
+        for dim in range(3):
+            positions[atom_index,dim] += shift
+            configurations.append(positions.copy())
+            positions[atom_index,dim] -= 2.0*shift
+            configurations.append(positions.copy())
+            positions[atom_index,dim] += shift
+
+        # If the charges are not relaxed and there are no other calculators,
+        # the energy only depends on the positions. Then, if the moves are
+        # so small that the neighbor lists are not rebuilt, all the energies
+        # can be calculated in one go with the current lists.
+        in_one_go = self.charge_relaxation is None and \
+            (self.extra_calculators is None or len(self.extra_calculators) == 0)
+        if in_one_go:
+            skin_squared = self.neighbor_list.skin**2
+            for conf in configurations:
+                if ((self.neighbor_list.positions - conf)**2).sum(1).max() > skin_squared:
+                    in_one_go = False
+
+        if in_one_go:
+            momenta = system.get_momenta().transpose()
+            energies = pf.pysic_interface.calculate_energies_of_configurations(
+                np.array(configurations).transpose(), momenta)
+            # restore the current positions in the core
+            pf.pysic_interface.update_atom_coordinates(orig_positions.transpose(), momenta)
+        else:
+            energies = []
+            for conf in configurations:
+                system.set_positions(conf)
+                energies.append(self.get_potential_energy())
+        [energy_xp, energy_xm, energy_yp, energy_ym, energy_zp, energy_zm] = energies
 
+        system.set_positions(orig_positions)
         self.energy == None
-        self.get_potential_energy(orig_system)
+        self.get_potential_energy()
                 
         return [ -(energy_xp-energy_xm)/(2.0*shift),
                  -(energy_yp-energy_ym)/(2.0*shift),
@@ -1686,7 +1705,10 @@ class Pysic:
             cutoffs: list of doubles
             new cutoffs
             """
-        self.saved_cutoffs = copy.deepcopy(cutoffs)
+        if cutoffs is None:
+            self.saved_cutoffs = None
+        else:
+            self.saved_cutoffs = np.array(cutoffs, dtype=np.float64)
             
             
     def neighbor_lists_expanded(self, cutoffs):
@@ -1702,18 +1724,15 @@ class Pysic:
         cutoffs: list of doubles
             new cutoffs
         """
-        if self.saved_cutoffs == None:
+        if self.saved_cutoffs is None:
             return True
-        if cutoffs == None:
+        if cutoffs is None:
             return True
                                 
         if len(self.saved_cutoffs) != len(cutoffs):
             return True
-        for old_cut, new_cut in zip(self.saved_cutoffs, cutoffs):
-            if old_cut < new_cut:
-                return True
                 
-        return False
+        return bool(np.any(self.saved_cutoffs < np.asarray(cutoffs)))
 
             
 
@@ -1723,53 +1742,46 @@ class Pysic:
 
         This is for debugging the bond orders."""
 
-        if(atoms == None):
-            system = self.structure.copy()
-            orig_system = self.structure.copy()
-        else:
-            system = atoms.copy()
-            orig_system = atoms.copy()
+        # the atoms are moved in the structure of the calculator itself,
+        # and only the original positions are saved for restoring them
+        self.set_atoms(atoms)
+        system = self.structure
+        orig_positions = system.get_positions()
 
         self.energy == None
         crd = coordinator
         system[moved_index].x += shift
-        self.set_atoms(system)
         self.set_core()
         crd.calculate_bond_order_factors()
         bond_xp = crd.get_bond_order_factors()[atom_index]
         system[moved_index].x -= 2.0*shift
-        self.set_atoms(system)
         self.set_core()
         crd.calculate_bond_order_factors()
         bond_xm = crd.get_bond_order_factors()[atom_index]
         system[moved_index].x += shift        
 
         system[moved_index].y += shift
-        self.set_atoms(system)
         self.set_core()
         crd.calculate_bond_order_factors()
         bond_yp = crd.get_bond_order_factors()[atom_index]
         system[moved_index].y -= 2.0*shift
-        self.set_atoms(system)
         self.set_core()
         crd.calculate_bond_order_factors()
         bond_ym = crd.get_bond_order_factors()[atom_index]
         system[moved_index].y += shift
 
         system[moved_index].z += shift
-        self.set_atoms(system)
         self.set_core()
         crd.calculate_bond_order_factors()
         bond_zp = crd.get_bond_order_factors()[atom_index]
         system[moved_index].z -= 2.0*shift
-        self.set_atoms(system)
         self.set_core()
         crd.calculate_bond_order_factors()
         bond_zm = crd.get_bond_order_factors()[atom_index]
         system[moved_index].z += shift
 
         self.energy == None
-        self.set_atoms(orig_system)
+        system.set_positions(orig_positions)
         self.set_core()
 
         
@@ -1784,20 +1796,22 @@ class Pysic:
             
             This is for debugging the electronegativities."""
         
+        # the charges are changed in the structure of the calculator itself,
+        # and only the original charges are saved for restoring them
         if(atoms == None):
-            system = self.structure.copy()
-            orig_system = self.structure.copy()
+            orig_system = None
         else:
-            system = atoms.copy()
             orig_system = self.structure.copy()
+            self.set_atoms(atoms)
+        system = self.structure
         
         try:
             charges = system.get_charges()
         except:
             charges = system.get_initial_charges()
+        orig_charges = np.copy(charges)
         
         self.energy == None
-        self.set_atoms(system)
         self.set_core()
         charges[atom_index] += 1.0*shift
 
@@ -1807,7 +1821,7 @@ class Pysic:
         except:
             system.set_initial_charges(charges)
 
-        energy_p = self.get_potential_energy(system)
+        energy_p = self.get_potential_energy()
         charges[atom_index] -= 2.0*shift
         
         # the call for charges was changed between ASE 3.6 and 3.7
@@ -1816,14 +1830,13 @@ class Pysic:
         except:
             system.set_initial_charges(charges)
 
-        energy_m = self.get_potential_energy(system)
-        charges[atom_index] += 1.0*shift
+        energy_m = self.get_potential_energy()
         
         # the call for charges was changed between ASE 3.6 and 3.7
         try:
-            system.set_charges(charges)
+            system.set_charges(orig_charges)
         except:
-            system.set_initial_charges(charges)
+            system.set_initial_charges(orig_charges)
                 
         self.energy == None
         self.set_atoms(orig_system)
@@ -513,6 +513,15 @@ class CoreMirror:
 
     """
 
+    atoms_mismatch = 1
+    """Flag for mismatching elements, positions or momenta in :meth:`~pysic.core.CoreMirror.state_mismatch`"""
+    charges_mismatch = 2
+    """Flag for mismatching charges in :meth:`~pysic.core.CoreMirror.state_mismatch`"""
+    cell_mismatch = 4
+    """Flag for mismatching supercell in :meth:`~pysic.core.CoreMirror.state_mismatch`"""
+    potentials_mismatch = 8
+    """Flag for mismatching potentials in :meth:`~pysic.core.CoreMirror.state_mismatch`"""
+
     def __init__(self):
         self.structure = None
         self.potentials = None
@@ -729,6 +738,59 @@ class CoreMirror:
                 return False
         return (self.potentials == pots)
 
+    def state_mismatch(self, atoms, pots):
+        """Checks which parts of the given atoms and potentials do not match those in the core.
+
+        This combines the checks of :meth:`~pysic.core.CoreMirror.atoms_ready`,
+        :meth:`~pysic.core.CoreMirror.charges_ready`,
+        :meth:`~pysic.core.CoreMirror.cell_ready`, and
+        :meth:`~pysic.core.CoreMirror.potentials_ready` in one call.
+        The result is a sum of the flags
+        :data:`~pysic.core.CoreMirror.atoms_mismatch`,
+        :data:`~pysic.core.CoreMirror.charges_mismatch`,
+        :data:`~pysic.core.CoreMirror.cell_mismatch`, and
+        :data:`~pysic.core.CoreMirror.potentials_mismatch`
+        for the parts that do not match, so 0 is returned if everything matches.
+
+        Parameters:
+
+        atoms: `ASE Atoms`_ object
+            The atoms to be compared.
+        pots: list of :class:`~pysic.interactions.local.Potential` objects
+            The potentials to be compared.
+        """
+        mismatch = 0
+        if not self.potentials_ready(pots):
+            mismatch |= CoreMirror.potentials_mismatch
+
+        if self.structure is None or atoms is None:
+            return mismatch | CoreMirror.atoms_mismatch | \
+                CoreMirror.charges_mismatch | CoreMirror.cell_mismatch
+
+        if not np.array_equal(self.structure.get_cell(), atoms.get_cell()) or \
+                not np.array_equal(self.structure.get_pbc(), atoms.get_pbc()):
+            mismatch |= CoreMirror.cell_mismatch
+
+        if len(self.structure) != len(atoms):
+            return mismatch | CoreMirror.atoms_mismatch | CoreMirror.charges_mismatch
+
+        if not np.array_equal(self.structure.get_atomic_numbers(), atoms.get_atomic_numbers()) or \
+                not np.array_equal(self.structure.get_positions(), atoms.get_positions()) or \
+                not np.array_equal(self.structure.get_momenta(), atoms.get_momenta()):
+            mismatch |= CoreMirror.atoms_mismatch
+
+        # the call for charges was changed between ASE 3.6 and 3.7
+        if hasattr(atoms, 'get_initial_charges'):
+            charges_match = np.array_equal(self.structure.get_initial_charges(),
+                                           atoms.get_initial_charges())
+        else:
+            charges_match = np.array_equal(self.structure.get_charges(),
+                                           atoms.get_charges())
+        if not charges_match:
+            mismatch |= CoreMirror.charges_mismatch
+
+        return mismatch
+
     def neighbor_lists_ready(self, lists):
         """Checks if the given neighbor lists match those in the core.
 
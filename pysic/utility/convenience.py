@@ -1,5 +1,7 @@
 #! /usr/bin/env python
 
+from math import factorial
+
 def expand_symbols_string(symbol_string):
     """Expands a string of chemical symbols to list.
     
@@ -38,6 +40,73 @@ def expand_symbols_string(symbol_string):
     return symbol_list
 
 
+def distinct_permutations(items):
+    """Lists the distinct permutations of the given items.
+    
+    Repeated items would make ``itertools.permutations`` produce the
+    same permutation several times. Here the permutations are generated
+    in lexicographic order so that each distinct permutation
+    is produced only once.
+    
+    Examples::
+    
+      >>> print distinct_permutations(['Si', 'O', 'O'])
+      [('O', 'O', 'Si'), ('O', 'Si', 'O'), ('Si', 'O', 'O')]
+    
+    Parameters:
+    
+    items: list
+        the items to be permuted
+    """
+
+    perm = sorted(items)
+    n_items = len(perm)
+    perm_list = [tuple(perm)]
+    while True:
+        # find the last item that is smaller than the one following it
+        first = n_items-2
+        while first >= 0 and perm[first] >= perm[first+1]:
+            first -= 1
+        if first < 0:
+            return perm_list
+
+        # swap it with the last item larger than it and
+        # reverse the tail to get the next permutation
+        last = n_items-1
+        while perm[last] <= perm[first]:
+            last -= 1
+        perm[first], perm[last] = perm[last], perm[first]
+        perm[first+1:] = reversed(perm[first+1:])
+        perm_list.append(tuple(perm))
+
+
+def distinct_permutation_count(items):
+    """Counts the distinct permutations of the given items.
+    
+    The result equals ``len(distinct_permutations(items))``, but it
+    is calculated from the multiplicities of the items as
+    :math:`n!/(k_1! \ldots k_m!)` without generating the permutations.
+    
+    Examples::
+    
+      >>> print distinct_permutation_count(['Si', 'O', 'O'])
+      3
+    
+    Parameters:
+    
+    items: list
+        the items to be permuted
+    """
+
+    multiplicities = {}
+    for item in items:
+        multiplicities[item] = multiplicities.get(item,0) + 1
+    count = factorial(len(items))
+    for k in multiplicities.values():
+        count //= factorial(k)
+    return count
+
+
 def expand_symbols_table(symbol_list,type=None):
     """Creates a table of symbols object.
             
@@ -4,6 +4,25 @@ from math import sqrt, pi, sin, cos, exp, fabs, floor
 import numpy as np
 
 
+def minimum_cell_width(cell):
+    """Returns the shortest distance between opposite faces of a cell.
+
+    The distance between the faces spanned by the vectors :math:`\mathbf{v}_j`
+    and :math:`\mathbf{v}_k` is the volume of the cell divided by the area
+    :math:`|\mathbf{v}_j \times \mathbf{v}_k|` of the face, and the volume
+    is the absolute value of the determinant of the cell matrix.
+
+    Parameters:
+
+    cell: 3x3 array of doubles
+        the vectors spanning the cell as rows
+    """
+    cell = np.asarray(cell, dtype=float)
+    normals = np.cross(cell[[1,2,0]], cell[[2,0,1]])
+    areas = np.sqrt((normals*normals).sum(axis=1))
+    return (abs(np.linalg.det(cell)) / areas).min()
+
+
 class Cell:
     """Cell describing the simulation volume of a subvolume.
          